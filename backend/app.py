@@ -1,20 +1,26 @@
 import os
+import asyncio
 import logging
-import uuid
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from typing import Dict, Any, List, Optional
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
+from fastapi import FastAPI, Request, UploadFile, File, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
 from pydantic import BaseModel
+import aiofiles
 import uvicorn
 
 from config import Config
-from services.pdf_extractor import PDFExtractor
+from services.pdf_extractor import PDFExtractor, TABLE_SETTINGS_PRESETS
 from services.llm_analyzer import OllamaAnalyzer
 from services.data_formatter import DataFormatter
 from utils.file_handler import FileHandler
 from utils.validators import Validators, ValidationError
+from utils.result_cache import ResultCache
 from models.schemas import ProcessingResponse, PatientInfo, LabResult
 
 # Configure logging
@@ -31,7 +37,24 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Configure CORS
+# Compress larger JSON responses (trend data grows with the number of tests)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Reject oversize requests from their Content-Length before the body is read
+@app.middleware("http")
+async def limit_content_length(request: Request, call_next):
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > Config.MAX_CONTENT_LENGTH:
+        return JSONResponse(
+            status_code=413,  # Content Too Large; the status constant was renamed across Starlette versions
+            content={
+                "success": False,
+                "error": f"File too large. Maximum size is {Config.MAX_CONTENT_LENGTH // (1024 * 1024)}MB"
+            }
+        )
+    return await call_next(request)
+
+# Configure CORS (added last so it wraps every other middleware, including 413 responses)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=Config.CORS_ORIGINS,
@@ -41,14 +64,32 @@ app.add_middleware(
 )
 
 # Initialize services
-pdf_extractor = PDFExtractor()
+result_cache = ResultCache(Config.CACHE_DIR, ttl=Config.CACHE_TTL)
+pdf_extractor = PDFExtractor(
+    max_workers=Config.PDF_PAGE_WORKERS,
+    table_settings=TABLE_SETTINGS_PRESETS.get(Config.PDF_TABLE_PRESET)
+)
 ollama_analyzer = OllamaAnalyzer(
     base_url=Config.OLLAMA_BASE_URL,
-    model=Config.OLLAMA_MODEL
+    model=Config.OLLAMA_MODEL,
+    batch_max=Config.OLLAMA_BATCH_MAX,
+    batch_window_ms=Config.OLLAMA_BATCH_WINDOW_MS,
+    availability_ttl=Config.OLLAMA_AVAILABILITY_TTL,
+    keep_alive=Config.OLLAMA_KEEP_ALIVE,
+    prompt_text_chars=Config.PROMPT_TEXT_CHARS,
+    prompt_table_rows=Config.PROMPT_TABLE_ROWS,
+    prompt_token_budget=Config.PROMPT_TOKEN_BUDGET,
+    num_ctx=Config.OLLAMA_NUM_CTX,
+    num_thread=Config.OLLAMA_NUM_THREAD,
+    cache=result_cache,
+    # The slot limit is per process, so split Ollama's parallel slots across the API workers
+    num_parallel=max(1, Config.OLLAMA_NUM_PARALLEL // Config.API_WORKERS)
 )
 data_formatter = DataFormatter()
 file_handler = FileHandler(Config.UPLOAD_FOLDER)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
 # Request/Response Models
 class TextAnalysisRequest(BaseModel):
     text: str
@@ -70,15 +111,6 @@ class APIResponse(BaseModel):
     data: Optional[Any] = None
     details: Optional[str] = None
 
-# Dependency to get services
-def get_services():
-    return {
-        'pdf_extractor': pdf_extractor,
-        'ollama_analyzer': ollama_analyzer,
-        'data_formatter': data_formatter,
-        'file_handler': file_handler
-    }
-
 # Exception handlers
 @app.exception_handler(ValidationError)
 async def validation_exception_handler(request, exc):
@@ -116,7 +148,7 @@ async def general_exception_handler(request, exc):
 async def health_check():
     """Health check endpoint"""
     try:
-        ollama_status = ollama_analyzer.is_available()
+        ollama_status = await ollama_analyzer.is_available()
         return HealthResponse(
             status="healthy",
             services={
@@ -133,11 +165,22 @@ async def health_check():
             detail=f"Health check failed: {str(e)}"
         )
 
+async def extract_in_pool(filepath: str) -> Dict[str, Any]:
+    """Run PDF extraction in the process pool, replacing the pool once if a worker died"""
+    loop = asyncio.get_running_loop()
+    pool = app.state.pool
+    try:
+        return await loop.run_in_executor(pool, pdf_extractor.extract_content, filepath)
+    except BrokenProcessPool:
+        # A crashed or OOM-killed extraction process breaks the whole pool for good
+        logger.warning("⚠️  PDF extraction pool broke, restarting it and retrying")
+        if app.state.pool is pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            app.state.pool = ProcessPoolExecutor(max_workers=Config.PDF_WORKERS)
+        return await loop.run_in_executor(app.state.pool, pdf_extractor.extract_content, filepath)
+
 @app.post("/api/upload", response_model=APIResponse)
-async def upload_pdf(
-    file: UploadFile = File(...),
-    services = Depends(get_services)
-):
+async def upload_pdf(file: UploadFile = File(...)):
     """Upload and process PDF file"""
     try:
         logger.info(f"📁 Processing upload: {file.filename}")
@@ -156,40 +199,78 @@ async def upload_pdf(
             )
         
         # Save uploaded file
-        temp_filename = f"{uuid.uuid4().hex}_{file.filename}"
+        temp_filename = f"{secrets.token_hex(8)}_{file.filename}"
         temp_filepath = os.path.join(Config.UPLOAD_FOLDER, temp_filename)
         
         try:
-            # Save file content
-            content = await file.read()
-            with open(temp_filepath, "wb") as f:
-                f.write(content)
-            
-            # Extract content from PDF
-            logger.info("🔍 Extracting PDF content...")
-            extracted_content = pdf_extractor.extract_content(temp_filepath)
-            
-            if extracted_content['status'] == 'error':
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Failed to extract PDF content"
-                )
+            # Stream file content to disk in chunks instead of buffering it in memory,
+            # hashing as we go so repeat uploads of the same PDF can be served from cache
+            # (requests without a Content-Length are capped here as bytes arrive)
+            hasher = ResultCache.hasher()
+            bytes_written = 0
+            async with aiofiles.open(temp_filepath, "wb") as f:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    bytes_written += len(chunk)
+                    if bytes_written > Config.MAX_CONTENT_LENGTH:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File too large. Maximum size is {Config.MAX_CONTENT_LENGTH // (1024 * 1024)}MB"
+                        )
+                    hasher.update(chunk)
+                    await f.write(chunk)
             
-            # Analyze with LLM
-            logger.info("🧠 Analyzing content with LLM...")
-            analyzed_data = ollama_analyzer.analyze_medical_data(extracted_content)
-            
-            # Format for frontend
-            logger.info("📊 Formatting data for frontend...")
-            formatted_data = data_formatter.format_for_frontend(analyzed_data)
+            # Key on everything that shapes the result, so changing the model, prompt limits or table
+            # preset doesn't serve an analysis made with the old settings
+            cache_key = "pdf:" + ResultCache.make_key(
+                hasher.hexdigest(),
+                Config.OLLAMA_MODEL,
+                str(Config.PROMPT_TEXT_CHARS),
+                str(Config.PROMPT_TABLE_ROWS),
+                str(Config.PROMPT_TOKEN_BUDGET),
+                Config.PDF_TABLE_PRESET
+            )
+            formatted_data = await asyncio.to_thread(result_cache.get, cache_key)
             
-            # Add processing metadata
-            formatted_data['processing_metadata'] = {
-                'filename': file.filename,
-                'extraction_metadata': extracted_content['metadata'],
-                'processing_timestamp': datetime.now().isoformat(),
-                'ollama_available': ollama_analyzer.is_available()
-            }
+            if formatted_data is not None:
+                logger.info("⚡ Identical PDF already processed, returning cached result")
+                formatted_data['processing_metadata'].update({
+                    'filename': file.filename,
+                    'processing_timestamp': datetime.now().isoformat(),
+                    'cache_hit': True
+                })
+            else:
+                # Extract content from PDF in the process pool so the event loop stays free
+                logger.info("🔍 Extracting PDF content...")
+                extracted_content = await extract_in_pool(temp_filepath)
+                
+                if extracted_content['status'] == 'error':
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Failed to extract PDF content"
+                    )
+                
+                # Analyze with LLM
+                logger.info("🧠 Analyzing content with LLM...")
+                analyzed_data, from_llm = await ollama_analyzer.analyze_medical_data_with_status(extracted_content)
+                
+                # Format for frontend
+                logger.info("📊 Formatting data for frontend...")
+                formatted_data = data_formatter.format_for_frontend(analyzed_data)
+                
+                # Add processing metadata
+                formatted_data['processing_metadata'] = {
+                    'filename': file.filename,
+                    'extraction_metadata': extracted_content['metadata'],
+                    'processing_timestamp': datetime.now().isoformat(),
+                    'ollama_available': await ollama_analyzer.is_available(),
+                    'llm_analyzed': from_llm,
+                    'cache_hit': False
+                }
+                
+                # Only cache real LLM results so uploads that got a fallback or placeholder
+                # (Ollama down, model missing, unparseable output) are re-analyzed next time
+                if from_llm:
+                    await asyncio.to_thread(result_cache.set, cache_key, formatted_data)
             
             logger.info("✅ PDF processing completed successfully")
             
@@ -201,8 +282,7 @@ async def upload_pdf(
             
         finally:
             # Clean up uploaded file
-            if os.path.exists(temp_filepath):
-                os.remove(temp_filepath)
+            file_handler.cleanup_file(temp_filepath)
     
     except HTTPException:
         raise
@@ -214,10 +294,7 @@ async def upload_pdf(
         )
 
 @app.post("/api/analyze", response_model=APIResponse)
-async def analyze_text(
-    request: TextAnalysisRequest,
-    services = Depends(get_services)
-):
+async def analyze_text(request: TextAnalysisRequest):
     """Analyze text content directly"""
     try:
         text_content = request.text
@@ -235,7 +312,7 @@ async def analyze_text(
         }
         
         # Analyze with LLM
-        analyzed_data = ollama_analyzer.analyze_medical_data(extracted_content)
+        analyzed_data = await ollama_analyzer.analyze_medical_data(extracted_content)
         
         # Format for frontend
         formatted_data = data_formatter.format_for_frontend(analyzed_data)
@@ -304,7 +381,7 @@ async def get_status():
             success=True,
             status={
                 'pdf_extractor': 'operational',
-                'ollama': 'available' if ollama_analyzer.is_available() else 'unavailable',
+                'ollama': 'available' if await ollama_analyzer.is_available() else 'unavailable',
                 'ollama_model': Config.OLLAMA_MODEL,
                 'upload_folder': Config.UPLOAD_FOLDER,
                 'max_file_size': str(Config.MAX_CONTENT_LENGTH)
@@ -333,7 +410,7 @@ async def root():
 async def get_available_models():
     """Get available Ollama models"""
     try:
-        if not ollama_analyzer.is_available():
+        if not await ollama_analyzer.is_available():
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="Ollama server is not available"
@@ -358,6 +435,31 @@ async def get_available_models():
             detail="Failed to get available models"
         )
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Ollama queue metrics in Prometheus text format, for the worker process serving the scrape"""
+    stats = ollama_analyzer.get_stats()
+    # Every API worker keeps its own queue and counters; the label tells scraped workers apart
+    worker = f'{{worker="{os.getpid()}"}}'
+    lines = [
+        "# HELP ollama_queue_depth Prompts waiting for the batch worker or a free Ollama slot (per worker process)",
+        "# TYPE ollama_queue_depth gauge",
+        f"ollama_queue_depth{worker} {stats['queued'] + stats['waiting']}",
+        "# HELP ollama_inflight_requests Generate requests currently running on Ollama (per worker process)",
+        "# TYPE ollama_inflight_requests gauge",
+        f"ollama_inflight_requests{worker} {stats['inflight']}",
+        "# HELP ollama_parallel_slots Maximum concurrent generate requests (per worker process)",
+        "# TYPE ollama_parallel_slots gauge",
+        f"ollama_parallel_slots{worker} {stats['num_parallel']}",
+        "# HELP ollama_requests_total Generate requests that returned a response (per worker process)",
+        "# TYPE ollama_requests_total counter",
+        f"ollama_requests_total{worker} {stats['completed']}",
+        "# HELP ollama_requests_failed_total Generate requests that errored or returned nothing (per worker process)",
+        "# TYPE ollama_requests_failed_total counter",
+        f"ollama_requests_failed_total{worker} {stats['failed']}"
+    ]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
@@ -370,9 +472,13 @@ async def startup_event():
     # Ensure upload folder exists
     os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
     
+    # Worker processes for CPU-bound PDF extraction
+    app.state.pool = ProcessPoolExecutor(max_workers=Config.PDF_WORKERS)
+    
     # Check Ollama availability
-    if ollama_analyzer.is_available():
+    if await ollama_analyzer.is_available():
         logger.info("✅ Ollama server is available")
+        await ollama_analyzer.preload()
     else:
         logger.warning("⚠️  Ollama server is not available - using fallback analysis")
 
@@ -381,12 +487,19 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("🛑 Shutting down Medical Lab PDF Processor API")
+    await ollama_analyzer.aclose()
+    app.state.pool.shutdown(wait=False, cancel_futures=True)
+    result_cache.close()
 
 if __name__ == "__main__":
+    # Development entrypoint; in production run: gunicorn -c gunicorn_conf.py app:app
+    dev_workers = 2
+    # Spawned workers inherit this and split Ollama's slots between them
+    os.environ['API_WORKERS'] = str(dev_workers)
     uvicorn.run(
-        "main:app",
+        "app:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        workers=dev_workers,
         log_level="info"
-    )
\ No newline at end of file
+    )
@@ -10,12 +10,44 @@ class Config:
     
     # Ollama settings
     OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
-    OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama2')
+    OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.1:8b-instruct-q4_K_M')
+    OLLAMA_NUM_CTX = int(os.getenv('OLLAMA_NUM_CTX', '0')) or None  # None = Ollama default
+    OLLAMA_NUM_THREAD = int(os.getenv('OLLAMA_NUM_THREAD', '0')) or None
+    # Dispatch grouping only: each prompt is still a separate generate request (Ollama has no batched
+    # generate), so the window just adds latency; set OLLAMA_BATCH_WINDOW_MS=0 to dispatch immediately
+    OLLAMA_BATCH_MAX = int(os.getenv('OLLAMA_BATCH_MAX', '8'))
+    OLLAMA_BATCH_WINDOW_MS = int(os.getenv('OLLAMA_BATCH_WINDOW_MS', '10'))
+    # Total concurrent generations across all API workers; keep in sync with the Ollama server's
+    # OLLAMA_NUM_PARALLEL. Each worker gets an equal share (at least 1), so keep API_WORKERS at or
+    # below this or Ollama sees up to API_WORKERS concurrent generations
+    OLLAMA_NUM_PARALLEL = int(os.getenv('OLLAMA_NUM_PARALLEL', '2'))
+    OLLAMA_AVAILABILITY_TTL = float(os.getenv('OLLAMA_AVAILABILITY_TTL', '30'))
+    OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '-1')  # -1 keeps the model resident
+    
+    # LLM prompt size limits
+    PROMPT_TEXT_CHARS = int(os.getenv('PROMPT_TEXT_CHARS', '2000'))
+    PROMPT_TABLE_ROWS = int(os.getenv('PROMPT_TABLE_ROWS', '10'))
+    PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '4096'))
+    
+    # API worker processes sharing this host and Ollama server; exported by gunicorn_conf.py and the
+    # python app.py entrypoint, and 1 for a single process (plain uvicorn, tests)
+    API_WORKERS = max(1, int(os.getenv('API_WORKERS', '1')))
     
     # File upload settings
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'pdf'}
+    # Extraction processes per API worker; the default shares the CPUs across API_WORKERS
+    PDF_WORKERS = int(os.getenv('PDF_WORKERS', '0')) or max(1, (os.cpu_count() or 1) // API_WORKERS)
+    # Per-document page workers; each upload already runs in its own PDF_WORKERS process,
+    # so raise this only when large multi-page reports dominate
+    PDF_PAGE_WORKERS = int(os.getenv('PDF_PAGE_WORKERS', '1'))
+    # Table detection preset: 'lines' (ruled tables) or 'fast' (text alignment, born-digital reports)
+    PDF_TABLE_PRESET = os.getenv('PDF_TABLE_PRESET', 'lines')
+    
+    # Result cache settings
+    CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+    CACHE_TTL = int(os.getenv('CACHE_TTL', str(24 * 60 * 60)))  # seconds
     
     # CORS settings
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://localhost:5173').split(',')
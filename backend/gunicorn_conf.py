@@ -0,0 +1,35 @@
+"""
+Gunicorn settings for running the API in production.
+
+Run from the backend directory with:
+    gunicorn -c gunicorn_conf.py app:app
+"""
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+# LLM calls are I/O-bound and Ollama only runs OLLAMA_NUM_PARALLEL generations at once, so
+# keep this small; extra workers only help with PDF extraction and cached responses
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# LLM analysis can take up to 120s per request, so allow headroom before killing a worker
+timeout = 180
+graceful_timeout = 30
+keepalive = 5
+
+loglevel = os.getenv('LOG_LEVEL', 'info')
+accesslog = '-'
+errorlog = '-'
+
+def on_starting(server):
+    """Tell the workers how many of them share Ollama's slots and the host's CPUs"""
+    # Uses the effective worker count, including a -w given on the command line
+    worker_count = server.cfg.workers
+    os.environ['API_WORKERS'] = str(worker_count)
+    
+    ollama_slots = int(os.getenv('OLLAMA_NUM_PARALLEL', '2'))
+    if worker_count > ollama_slots:
+        server.log.warning(
+            "%d workers share %d Ollama slots; each worker still runs 1 generation, so Ollama "
+            "may see %d concurrent requests", worker_count, ollama_slots, worker_count
+        )
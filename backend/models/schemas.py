@@ -1,12 +1,17 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, constr
 from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime
 
+# Shared settings for all schema models
+_MODEL_CONFIG = ConfigDict(populate_by_name=True, extra='ignore', arbitrary_types_allowed=False)
+
 class ReferenceRange(BaseModel):
+    model_config = _MODEL_CONFIG
     min: float
     max: float
 
 class LabResult(BaseModel):
+    model_config = _MODEL_CONFIG
     id: str
     testName: str
     value: float
@@ -16,13 +21,24 @@ class LabResult(BaseModel):
     date: str
     category: str
 
+class LabResultInput(BaseModel):
+    """Loosely typed lab result as submitted, before normalization"""
+    model_config = _MODEL_CONFIG
+    testName: constr(strip_whitespace=True) = ""
+    value: float = 0.0
+    unit: constr(strip_whitespace=True) = ""
+    status: str = "normal"
+    category: str = "blood"
+
 class TrendData(BaseModel):
+    model_config = _MODEL_CONFIG
     date: str
     value: float
     testName: str
     status: Literal['normal', 'high', 'low', 'critical']
 
 class PatientInfo(BaseModel):
+    model_config = _MODEL_CONFIG
     id: str
     name: str
     age: Optional[int] = None
@@ -31,6 +47,7 @@ class PatientInfo(BaseModel):
     lastTestDate: str
 
 class TestCategory(BaseModel):
+    model_config = _MODEL_CONFIG
     id: str
     name: str
     description: str
@@ -38,6 +55,7 @@ class TestCategory(BaseModel):
     tests: List[str]
 
 class ProcessingResponse(BaseModel):
+    model_config = _MODEL_CONFIG
     patientInfo: PatientInfo
     latestResults: List[LabResult]
     testCategories: List[TestCategory]
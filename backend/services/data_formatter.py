@@ -1,36 +1,121 @@
-import uuid
+import secrets
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Sequence, Tuple
 import numpy as np
+from pydantic import TypeAdapter, ValidationError as SchemaValidationError
+
+from models.schemas import LabResult
 
 logger = logging.getLogger(__name__)
 
+# Shared, read-only fallback categories returned as-is in responses (never mutate)
+_DEFAULT_CATEGORIES: Tuple[Dict[str, Any], ...] = (
+    {
+        "id": "blood",
+        "name": "Complete Blood Count",
+        "description": "Blood cell counts and basic blood chemistry",
+        "color": "hsl(var(--chart-primary))",
+        "tests": ("hemoglobin", "hematocrit", "wbc", "platelets")
+    },
+    {
+        "id": "lipid",
+        "name": "Lipid Panel",
+        "description": "Cholesterol and triglyceride levels",
+        "color": "hsl(var(--chart-secondary))",
+        "tests": ("totalCholesterol", "hdl", "ldl", "triglycerides")
+    },
+    {
+        "id": "liver",
+        "name": "Liver Function",
+        "description": "Liver enzyme and protein levels",
+        "color": "hsl(var(--chart-tertiary))",
+        "tests": ("alt", "ast", "bilirubin", "albumin")
+    },
+    {
+        "id": "kidney",
+        "name": "Kidney Function",
+        "description": "Kidney function markers",
+        "color": "hsl(var(--chart-quaternary))",
+        "tests": ("creatinine", "bun", "gfr")
+    },
+)
+
+# Validate and serialize all lab results in one pass through pydantic-core
+_LAB_RESULTS_ADAPTER = TypeAdapter(List[LabResult])
+_LAB_RESULT_ADAPTER = TypeAdapter(LabResult)
+
+def _safe_float(value: Any) -> Optional[float]:
+    """Convert value to float, returning None instead of raising"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+_ALLOWED_STATUS = frozenset({"normal", "high", "low", "critical"})
+
+def _normalize_lab_result(result: Dict[str, Any], today: str) -> Optional[Dict[str, Any]]:
+    """
+    Coerce a raw LLM lab result into the LabResult shape (string ids, lowercase clamped status,
+    defaults for null fields); None if the value is not numeric
+    """
+    value = _safe_float(result.get("value", 0))
+    if value is None:
+        return None
+    
+    reference_range = result.get("referenceRange")
+    if not isinstance(reference_range, dict):
+        reference_range = {}
+    ref_min = _safe_float(reference_range.get("min"))
+    ref_max = _safe_float(reference_range.get("max"))
+    
+    status = str(result.get("status") or "normal").strip().lower()
+    result_id = result.get("id")
+    return {
+        "id": str(result_id) if result_id not in (None, "") else f"r_{secrets.token_hex(4)}",
+        "testName": str(result.get("testName") or "Unknown Test"),
+        "value": value,
+        "unit": str(result.get("unit") or ""),
+        "referenceRange": {
+            "min": 0.0 if ref_min is None else ref_min,
+            "max": 100.0 if ref_max is None else ref_max
+        },
+        "status": status if status in _ALLOWED_STATUS else "normal",
+        "date": str(result.get("date") or today),
+        "category": str(result.get("category") or "blood")
+    }
+
+# Static part of the empty patient info; only lastTestDate varies per response
+_EMPTY_PATIENT_INFO: Dict[str, Any] = {
+    "id": "empty",
+    "name": "No Data",
+    "age": None,
+    "gender": None,
+    "dateOfBirth": None
+}
+
 class DataFormatter:
     """Format analyzed data to match frontend schema"""
     
     def __init__(self):
-        self.default_categories = self._get_default_categories()
+        self.default_categories = _DEFAULT_CATEGORIES
     
     def format_for_frontend(self, analyzed_data: Dict[str, Any]) -> Dict[str, Any]:
         """Format analyzed data to match frontend schema exactly"""
         try:
-            # Generate trend data for each test
-            trend_data = {}
-            latest_results = analyzed_data.get("latestResults", [])
+            latest_results = self._format_latest_results(analyzed_data.get("latestResults") or [])
             
+            # Generate trend data for each validated test so trends and latest results always match
+            trend_data = {}
             for result in latest_results:
-                test_name = result.get("testName", "").lower().replace(" ", "")
-                if test_name and result.get("value") is not None:
-                    trend_data[test_name] = self._generate_trend_data(
-                        result["testName"], 
-                        result["value"]
-                    )
+                test_name = result["testName"].lower().replace(" ", "")
+                if test_name:
+                    trend_data[test_name] = self._generate_trend_data(result["testName"], result["value"])
             
             # Format final response
             formatted_response = {
                 "patientInfo": self._format_patient_info(analyzed_data.get("patientInfo", {})),
-                "latestResults": self._format_latest_results(latest_results),
+                "latestResults": latest_results,
                 "testCategories": self._format_test_categories(analyzed_data.get("testCategories", [])),
                 "trendData": trend_data
             }
@@ -45,7 +130,7 @@ class DataFormatter:
     def _format_patient_info(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
         """Format patient information"""
         return {
-            "id": patient_data.get("id", f"p_{uuid.uuid4().hex[:8]}"),
+            "id": patient_data.get("id") or f"p_{secrets.token_hex(4)}",
             "name": patient_data.get("name", "Unknown Patient"),
             "age": patient_data.get("age"),
             "gender": patient_data.get("gender"),
@@ -55,28 +140,32 @@ class DataFormatter:
     
     def _format_latest_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Format latest results"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        # Normalize LLM quirks (capitalized status, null unit/date/bounds, integer ids) before the
+        # strict schema sees them; non-dict entries and non-numeric values are dropped up front
         formatted_results = []
-        
         for result in results:
-            try:
-                formatted_result = {
-                    "id": result.get("id", f"r_{uuid.uuid4().hex[:8]}"),
-                    "testName": result.get("testName", "Unknown Test"),
-                    "value": float(result.get("value", 0)),
-                    "unit": result.get("unit", ""),
-                    "referenceRange": result.get("referenceRange", {"min": 0, "max": 100}),
-                    "status": result.get("status", "normal"),
-                    "date": result.get("date", datetime.now().strftime("%Y-%m-%d")),
-                    "category": result.get("category", "blood")
-                }
-                formatted_results.append(formatted_result)
-            except Exception as e:
-                logger.warning(f"⚠️  Error formatting result {result}: {str(e)}")
+            normalized = _normalize_lab_result(result, today) if isinstance(result, dict) else None
+            if normalized is None:
+                logger.warning(f"⚠️  Skipping lab result without a numeric value or not an object: {result}")
                 continue
+            formatted_results.append(normalized)
         
-        return formatted_results
+        try:
+            return _LAB_RESULTS_ADAPTER.dump_python(_LAB_RESULTS_ADAPTER.validate_python(formatted_results))
+        except SchemaValidationError:
+            # Validate item by item so one bad result doesn't drop the rest
+            valid_results = []
+            for formatted_result in formatted_results:
+                try:
+                    valid_results.append(
+                        _LAB_RESULT_ADAPTER.dump_python(_LAB_RESULT_ADAPTER.validate_python(formatted_result))
+                    )
+                except SchemaValidationError as e:
+                    logger.warning(f"⚠️  Error formatting result {formatted_result}: {str(e)}")
+            return valid_results
     
-    def _format_test_categories(self, categories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _format_test_categories(self, categories: List[Dict[str, Any]]) -> Sequence[Dict[str, Any]]:
         """Format test categories"""
         if not categories:
             return self.default_categories
@@ -100,74 +189,34 @@ class DataFormatter:
     
     def _generate_trend_data(self, test_name: str, current_value: float) -> List[Dict[str, Any]]:
         """Generate trend data for the last 12 months"""
-        trend_data = []
+        now = datetime.now()
+        dates = [(now - timedelta(days=30*i)).strftime("%Y-%m") for i in range(11, -1, -1)]
         
-        # Generate 12 months of data
-        for i in range(11, -1, -1):
-            date = (datetime.now() - timedelta(days=30*i)).strftime("%Y-%m")
-            
-            # Add realistic variation (±20% of current value)
-            variation = (np.random.random() - 0.5) * 0.4 * current_value
-            value = max(0, current_value + variation)
-            
-            # Simple status determination
-            status = "normal"
-            if abs(variation) > 0.15 * current_value:
-                status = "high" if variation > 0 else "low"
-            
-            trend_data.append({
-                "date": date,
-                "value": round(value, 1),
-                "testName": test_name,
-                "status": status
-            })
+        # Add realistic variation (±20% of current value) for all 12 months at once
+        variations = np.random.uniform(-0.2, 0.2, 12) * current_value
+        values = np.maximum(0, current_value + variations).round(1)
+        
+        # Simple status determination
+        statuses = np.where(
+            np.abs(variations) > 0.15 * current_value,
+            np.where(variations > 0, "high", "low"),
+            "normal"
+        )
         
-        return trend_data
-    
-    def _get_default_categories(self) -> List[Dict[str, Any]]:
-        """Get default test categories"""
         return [
             {
-                "id": "blood",
-                "name": "Complete Blood Count",
-                "description": "Blood cell counts and basic blood chemistry",
-                "color": "hsl(var(--chart-primary))",
-                "tests": ["hemoglobin", "hematocrit", "wbc", "platelets"]
-            },
-            {
-                "id": "lipid",
-                "name": "Lipid Panel",
-                "description": "Cholesterol and triglyceride levels",
-                "color": "hsl(var(--chart-secondary))",
-                "tests": ["totalCholesterol", "hdl", "ldl", "triglycerides"]
-            },
-            {
-                "id": "liver",
-                "name": "Liver Function",
-                "description": "Liver enzyme and protein levels",
-                "color": "hsl(var(--chart-tertiary))",
-                "tests": ["alt", "ast", "bilirubin", "albumin"]
-            },
-            {
-                "id": "kidney",
-                "name": "Kidney Function",
-                "description": "Kidney function markers",
-                "color": "hsl(var(--chart-quaternary))",
-                "tests": ["creatinine", "bun", "gfr"]
+                "date": date,
+                "value": value,
+                "testName": test_name,
+                "status": status
             }
+            for date, value, status in zip(dates, values.tolist(), statuses.tolist())
         ]
     
     def _get_empty_response(self) -> Dict[str, Any]:
         """Get empty response structure"""
         return {
-            "patientInfo": {
-                "id": "empty",
-                "name": "No Data",
-                "age": None,
-                "gender": None,
-                "dateOfBirth": None,
-                "lastTestDate": datetime.now().strftime("%Y-%m-%d")
-            },
+            "patientInfo": {**_EMPTY_PATIENT_INFO, "lastTestDate": datetime.now().strftime("%Y-%m-%d")},
             "latestResults": [],
             "testCategories": self.default_categories,
             "trendData": {}
@@ -1,52 +1,235 @@
+import asyncio
 import json
 import logging
-import requests
 import re
-from typing import Dict, List, Any, Optional
+import time
+from typing import Dict, List, Any, Optional, Set, Tuple
+import httpx
+
+from utils.result_cache import ResultCache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Greedy match of the outermost JSON object in an LLM response
+_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+def _json_loads(data: Any) -> Any:
+    """Parse JSON with orjson when installed, stdlib json otherwise"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def _json_dumps(obj: Any) -> str:
+    """Serialize compact JSON with orjson when installed, stdlib json otherwise"""
+    return orjson.dumps(obj).decode() if orjson else json.dumps(obj, separators=(',', ':'))
+
+class _JsonObjectTracker:
+    """
+    Find the first complete top-level JSON object in streamed text. Braces inside JSON strings are
+    ignored, and a balanced {...} that does not parse (e.g. "{placeholders}" in a preamble) is
+    skipped rather than treated as the end of the response
+    """
+    
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.value: Any = None
+        self.end = 0
+        self._candidate: List[str] = []
+    
+    def feed(self, token: str) -> bool:
+        """
+        Consume a token; return True once an object has closed and parsed, leaving the parsed
+        object in value and the index just past its closing brace (within token) in end
+        """
+        start = 0 if self.depth else None
+        for index, char in enumerate(token):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                # Quotes in any preamble before the object are plain text
+                self.in_string = self.depth > 0
+            elif char == '{':
+                if not self.depth:
+                    start = index
+                self.depth += 1
+            elif char == '}' and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    candidate = "".join(self._candidate) + token[start:index + 1]
+                    self._candidate = []
+                    try:
+                        self.value = _json_loads(candidate)
+                    except ValueError:
+                        # Not JSON after all; keep scanning for the real object
+                        start = None
+                        continue
+                    self.end = index + 1
+                    return True
+        
+        if self.depth:
+            self._candidate.append(token[start:])
+        return False
+
 class OllamaAnalyzer:
     """Analyze extracted PDF content using Ollama LLM"""
     
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "deepseek-r1:8b"):
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        model: str = "deepseek-r1:8b",
+        batch_max: int = 8,
+        batch_window_ms: int = 10,
+        availability_ttl: float = 30.0,
+        keep_alive: str = "-1",
+        prompt_text_chars: int = 2000,
+        prompt_table_rows: int = 10,
+        prompt_token_budget: int = 4096,
+        num_ctx: Optional[int] = None,
+        num_thread: Optional[int] = None,
+        cache: Optional[ResultCache] = None,
+        num_parallel: int = 2
+    ):
         self.base_url = base_url
         self.model = model
         self.api_url = f"{base_url}/api"
+        self.batch_max = max(1, batch_max)
+        self.batch_window = batch_window_ms / 1000
+        
+        self.availability_ttl = availability_ttl
+        self.prompt_text_chars = prompt_text_chars
+        self.prompt_table_rows = prompt_table_rows
+        self.prompt_token_budget = prompt_token_budget
+        self.cache = cache
+        
+        # Runtime options sent with every request; num_ctx/num_thread are only set when configured
+        # so Ollama keeps its own defaults (a changed num_ctx forces a model reload)
+        self.runtime_options: Dict[str, Any] = {}
+        if num_ctx:
+            self.runtime_options["num_ctx"] = num_ctx
+        if num_thread:
+            self.runtime_options["num_thread"] = num_thread
+        
+        # Ollama takes either a number of seconds (-1 keeps the model loaded) or a duration like "10m"
+        self.keep_alive = int(keep_alive) if keep_alive.lstrip('-').isdigit() else keep_alive
+        
+        # Shared client so every Ollama call reuses pooled keep-alive connections
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=120,
+            limits=httpx.Limits(max_keepalive_connections=32)
+        )
+        
+        # Cached (checked_at, available) result of the last availability probe
+        self._availability: Optional[Tuple[float, bool]] = None
+        
+        # Prompt queue drained by a background batch worker (created lazily on the running loop)
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        self._dispatch_tasks: Set[asyncio.Task] = set()
+        
+        # Bound this process's concurrent generations; extra prompts wait here. The semaphore is
+        # per process, so with several API workers the caller passes each worker its share of
+        # Ollama's parallel slots
+        self.num_parallel = max(1, num_parallel)
+        self._slots = asyncio.Semaphore(self.num_parallel)
+        self._waiting = 0
+        self._inflight = 0
+        self._completed = 0
+        self._failed = 0
     
-    def is_available(self) -> bool:
-        """Check if Ollama server is available"""
+    async def is_available(self) -> bool:
+        """Check if Ollama server is available (cached for availability_ttl seconds)"""
+        now = time.monotonic()
+        if self._availability is not None and now - self._availability[0] < self.availability_ttl:
+            return self._availability[1]
+        
+        try:
+            response = await self._client.get("/api/tags", timeout=5)
+            available = response.status_code == 200
+        except Exception:
+            available = False
+        
+        self._availability = (now, available)
+        return available
+    
+    async def preload(self) -> bool:
+        """Load model weights and tokenizer into Ollama so the first request skips the cold start"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            return response.status_code == 200
-        except:
+            response = await self._client.post("/api/generate", json={
+                "model": self.model,
+                "prompt": "",
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": {**self.runtime_options, "num_predict": 1}
+            })
+            if response.status_code != 200:
+                logger.warning(f"⚠️  Ollama preload failed: {response.status_code}")
+                return False
+            
+            await self._client.post("/api/show", json={"name": self.model})
+            logger.info(f"🔥 Ollama model preloaded: {self.model}")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️  Ollama preload failed: {str(e)}")
             return False
     
-    def analyze_medical_data(self, extracted_content: Dict[str, Any]) -> Dict[str, Any]:
+    async def analyze_medical_data(self, extracted_content: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze extracted medical PDF content"""
-        if not self.is_available():
+        analysis, _ = await self.analyze_medical_data_with_status(extracted_content)
+        return analysis
+    
+    async def analyze_medical_data_with_status(self, extracted_content: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Analyze extracted medical PDF content and return (analysis, from_llm), where from_llm is
+        False for fallback and placeholder results that must not be cached
+        """
+        if not await self.is_available():
             logger.warning("⚠️  Ollama server not available")
-            return self._fallback_analysis(extracted_content)
+            return self._fallback_analysis(extracted_content), False
         
         try:
-            # Prepare content for analysis
-            analysis_prompt = self._create_medical_analysis_prompt(extracted_content)
+            # Prepare content for analysis off the event loop (string building and JSON serialization)
+            analysis_prompt = await asyncio.to_thread(self._create_medical_analysis_prompt, extracted_content)
+            
+            # Identical prompts to the same model are answered from cache
+            cache_key = f"analysis:{ResultCache.make_key(self.model, analysis_prompt)}"
+            if self.cache is not None:
+                cached = await asyncio.to_thread(self.cache.get, cache_key)
+                if cached is not None:
+                    logger.info("⚡ Using cached Ollama analysis")
+                    return cached, True
             
             # Get LLM response
-            response = self._generate_response(analysis_prompt)
+            response = await self._generate_response(analysis_prompt)
             
             if response:
                 # Parse the response
-                parsed_result = self._parse_medical_response(response)
+                parsed_result = await asyncio.to_thread(self._parse_medical_response, response)
+                if parsed_result is None:
+                    logger.warning("⚠️  Ollama response did not contain valid medical JSON")
+                    return self._extract_medical_info_from_text(response), False
+                
                 logger.info("✅ Ollama analysis completed")
-                return parsed_result
+                if self.cache is not None:
+                    await asyncio.to_thread(self.cache.set, cache_key, parsed_result)
+                return parsed_result, True
             else:
                 logger.warning("⚠️  Empty Ollama response")
-                return self._fallback_analysis(extracted_content)
+                return self._fallback_analysis(extracted_content), False
                 
         except Exception as e:
             logger.error(f"❌ Error in Ollama analysis: {str(e)}")
-            return self._fallback_analysis(extracted_content)
+            return self._fallback_analysis(extracted_content), False
     
     def _create_medical_analysis_prompt(self, extracted_content: Dict[str, Any]) -> str:
         """Create prompt for medical data analysis"""
@@ -60,17 +243,38 @@ class OllamaAnalyzer:
             rows = table.get("rows", [])
             tables_summary.append(f"Table with headers: {', '.join(headers[:5])} and {len(rows)} rows")
         
-        prompt = f"""
+        # Only headers and the first rows of each table go to the LLM; prefill cost grows with prompt length
+        compact_tables = [
+            {"headers": table.get("headers", []), "rows": table.get("rows", [])[:self.prompt_table_rows]}
+            for table in tables[:3]
+        ]
+        prompt = self._render_medical_analysis_prompt(text, tables_summary, _json_dumps(compact_tables))
+        
+        # Rough token estimate (~4 characters per token); drop table rows if over budget
+        estimated_tokens = len(prompt) // 4
+        if estimated_tokens > self.prompt_token_budget:
+            logger.warning(
+                f"⚠️  Prompt ~{estimated_tokens} tokens exceeds budget of {self.prompt_token_budget}, "
+                "sending table headers only"
+            )
+            headers_only = [{"headers": table["headers"]} for table in compact_tables]
+            prompt = self._render_medical_analysis_prompt(text, tables_summary, _json_dumps(headers_only))
+        
+        return prompt
+    
+    def _render_medical_analysis_prompt(self, text: str, tables_summary: List[str], table_data: str) -> str:
+        """Render the medical analysis prompt template"""
+        return f"""
 You are a medical data analyst. Analyze the following medical lab report and extract structured information.
 
 TEXT CONTENT:
-{text[:2000]}...
+{text[:self.prompt_text_chars]}...
 
 TABLES FOUND:
 {chr(10).join(tables_summary)}
 
 DETAILED TABLE DATA:
-{json.dumps(tables[:3], indent=2)}
+{table_data}
 
 Please analyze this medical lab report and respond with ONLY a valid JSON object in this exact format:
 {{
@@ -115,63 +319,163 @@ IMPORTANT INSTRUCTIONS:
 7. Return ONLY valid JSON, no additional text or explanations
 8. If information is missing, use null or generate realistic placeholders
 """
+    
+    async def _generate_response(self, prompt: str) -> str:
+        """Queue prompt for the batch worker and wait for its response"""
+        loop = asyncio.get_running_loop()
+        if self._batch_task is None or self._batch_task.done():
+            self._queue = asyncio.Queue()
+            self._batch_task = loop.create_task(self._batch_worker())
         
-        return prompt
+        future = loop.create_future()
+        await self._queue.put((prompt, future))
+        return await future
+    
+    async def _batch_worker(self):
+        """
+        Collect prompts arriving within the batch window and dispatch them together. Ollama's
+        /api/generate takes one prompt per request, so this only groups dispatch: each prompt is
+        still its own generate call, bounded by the slot semaphore in _run_prompt
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            
+            while len(batch) < self.batch_max:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Dispatch without waiting so the next batch can start filling immediately
+            task = loop.create_task(self._dispatch_batch(batch))
+            self._dispatch_tasks.add(task)
+            task.add_done_callback(self._dispatch_tasks.discard)
+    
+    async def _dispatch_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Fan a batch of prompts out to Ollama as separate generate requests and resolve each waiter"""
+        logger.info(f"📦 Dispatching batch of {len(batch)} prompt(s) to Ollama")
+        await asyncio.gather(
+            *(self._run_prompt(prompt, future) for prompt, future in batch),
+            return_exceptions=True
+        )
+    
+    async def _run_prompt(self, prompt: str, future: asyncio.Future):
+        """Generate a response for one waiter, aborting the generation if the waiter is cancelled"""
+        if future.done():
+            return
+        
+        # A cancelled waiter (e.g. client disconnected) cancels this task, which closes the stream
+        task = asyncio.current_task()
+        future.add_done_callback(lambda f: task.cancel() if f.cancelled() else None)
+        
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        
+        self._inflight += 1
+        try:
+            response = await self._post_generate(prompt)
+        finally:
+            self._inflight -= 1
+            self._slots.release()
+        
+        # Cancelled generations never get here; failed ones come back as an empty response
+        if response:
+            self._completed += 1
+        else:
+            self._failed += 1
+        
+        if not future.done():
+            future.set_result(response)
     
-    def _generate_response(self, prompt: str) -> str:
-        """Generate response using Ollama"""
+    async def _post_generate(self, prompt: str) -> str:
+        """Stream a response for a single prompt from Ollama, stopping once the JSON object is complete"""
         try:
             payload = {
                 "model": self.model,
                 "prompt": prompt,
-                "stream": False,
+                "stream": True,
+                "keep_alive": self.keep_alive,
                 "options": {
+                    **self.runtime_options,
                     "num_predict": 2000,
                     "temperature": 0.1,
                     "top_p": 0.9
                 }
             }
             
-            response = requests.post(
-                f"{self.api_url}/generate",
-                json=payload,
-                timeout=120
-            )
-            
-            if response.status_code == 200:
-                return response.json().get("response", "")
-            else:
-                logger.error(f"Ollama API error: {response.status_code}")
-                return ""
+            chunks = []
+            tracker = _JsonObjectTracker()
+            async with self._client.stream("POST", "/api/generate", json=payload) as response:
+                if response.status_code != 200:
+                    logger.error(f"Ollama API error: {response.status_code}")
+                    return ""
                 
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = _json_loads(line)
+                    token = chunk.get("response", "")
+                    chunks.append(token)
+                    
+                    # Leaving the stream early closes the connection, which stops generation in Ollama
+                    if tracker.feed(token) or chunk.get("done"):
+                        break
+            
+            return "".join(chunks)
+        
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"Error calling Ollama: {str(e)}")
             return ""
     
-    def _parse_medical_response(self, response: str) -> Dict[str, Any]:
-        """Parse Ollama response and extract JSON"""
-        try:
-            # Try to find JSON in the response
-            json_pattern = r'\{.*\}'
-            json_match = re.search(json_pattern, response, re.DOTALL)
-            
-            if json_match:
-                json_str = json_match.group()
-                parsed = json.loads(json_str)
-                
-                # Validate structure
-                if self._validate_medical_structure(parsed):
+    def get_stats(self) -> Dict[str, int]:
+        """Return this process's queue depth and generation counters"""
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "waiting": self._waiting,
+            "inflight": self._inflight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "num_parallel": self.num_parallel
+        }
+    
+    async def aclose(self):
+        """Stop the batch worker and close pooled connections"""
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            self._batch_task = None
+        await self._client.aclose()
+    
+    def _parse_medical_response(self, response: str) -> Optional[Dict[str, Any]]:
+        """Parse Ollama response and extract JSON; None if it holds no valid medical structure"""
+        # Fast path: the whole outermost {...} span is the object
+        json_match = _JSON_RE.search(response)
+        if json_match:
+            try:
+                parsed = _json_loads(json_match.group())
+                if isinstance(parsed, dict) and self._validate_medical_structure(parsed):
                     return parsed
-            
-            # If parsing fails, try to extract information manually
-            return self._extract_medical_info_from_text(response)
-            
-        except json.JSONDecodeError as e:
-            logger.warning(f"⚠️  JSON parsing error: {str(e)}")
-            return self._extract_medical_info_from_text(response)
-        except Exception as e:
-            logger.error(f"❌ Error parsing Ollama response: {str(e)}")
-            return self._fallback_analysis({})
+            except json.JSONDecodeError:
+                pass
+        
+        # Otherwise the span also covers braces in surrounding prose; check each object in turn
+        remaining = response
+        while True:
+            tracker = _JsonObjectTracker()
+            if not tracker.feed(remaining):
+                return None
+            if isinstance(tracker.value, dict) and self._validate_medical_structure(tracker.value):
+                return tracker.value
+            remaining = remaining[tracker.end:]
     
     def _validate_medical_structure(self, data: Dict[str, Any]) -> bool:
         """Validate the structure of medical data"""
@@ -1,50 +1,190 @@
 import logging
-from typing import Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, Any, Iterator, List, Optional
 import pdfplumber
 
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
 logger = logging.getLogger(__name__)
 
+# Below this many pages, process startup costs more than parallel extraction saves
+MIN_PARALLEL_PAGES = 4
+
+# Table detection settings, understood by both pdfplumber's extract_tables and PyMuPDF's find_tables.
+# "lines" only looks for ruled tables; "fast" infers columns from word alignment and skips the
+# edge/intersection pass, which suits born-digital reports without vector rulings.
+DEFAULT_TABLE_SETTINGS: Dict[str, Any] = {"vertical_strategy": "lines", "horizontal_strategy": "lines", "snap_tolerance": 3}
+FAST_TABLE_SETTINGS: Dict[str, Any] = {"vertical_strategy": "text", "horizontal_strategy": "text", "snap_tolerance": 3}
+TABLE_SETTINGS_PRESETS: Dict[str, Dict[str, Any]] = {"lines": DEFAULT_TABLE_SETTINGS, "fast": FAST_TABLE_SETTINGS}
+
+def _table_entry(page_num: int, table_idx: int, headers: List[Any], rows: List[List[Any]]) -> Dict[str, Any]:
+    return {
+        "id": f"table_{page_num}_{table_idx}",
+        "page": page_num + 1,
+        "headers": headers,
+        "rows": rows,
+        "row_count": len(rows),
+        "column_count": len(headers)
+    }
+
+def _skipped_page(page_num: int) -> Dict[str, Any]:
+    # Page without a text layer (OCR candidate)
+    return {"page": page_num + 1, "text": "", "tables": [], "skipped": True}
+
+def _pymupdf_page(page, page_num: int, enable_tables: bool, table_settings: Dict[str, Any]) -> Dict[str, Any]:
+    text = page.get_text("text")
+    # Scanned/image-only pages have no text layer; skip table detection over their drawings
+    if not text.strip():
+        return _skipped_page(page_num)
+
+    tables = []
+    if enable_tables:
+        for table_idx, table in enumerate(page.find_tables(**table_settings).tables):
+            rows = table.extract()
+            headers = table.header.names
+            # An in-table header is also the first extracted row; drop it in place instead of copying
+            if rows and not table.header.external:
+                del rows[0]
+            tables.append(_table_entry(page_num, table_idx, headers, rows))
+    return {"page": page_num + 1, "text": text, "tables": tables, "skipped": False}
+
+def _pdfplumber_page(page, page_num: int, enable_tables: bool, table_settings: Dict[str, Any]) -> Dict[str, Any]:
+    # No character objects means a scanned/image-only page; skip text layout and table detection
+    if not page.chars:
+        return _skipped_page(page_num)
+
+    tables = []
+    if enable_tables:
+        for table_idx, table in enumerate(page.extract_tables(table_settings=table_settings)):
+            if table:
+                # extract_tables returns fresh lists, so the table itself becomes the rows
+                # once its header row is removed (no table[1:] copy)
+                headers = table[0]
+                del table[0]
+                tables.append(_table_entry(page_num, table_idx, headers, table))
+    return {"page": page_num + 1, "text": page.extract_text() or "", "tables": tables, "skipped": False}
+
+def _extract_page_range(
+    pdf_path: str, start: int, stop: int, enable_tables: bool, table_settings: Dict[str, Any], method: str
+) -> List[Dict[str, Any]]:
+    """Process-pool worker: open the PDF and extract pages [start, stop)"""
+    if method == "pymupdf":
+        with pymupdf.open(pdf_path) as doc:
+            return [_pymupdf_page(doc[page_num], page_num, enable_tables, table_settings) for page_num in range(start, stop)]
+
+    with pdfplumber.open(pdf_path, pages=range(start + 1, stop + 1)) as pdf:
+        return [
+            _pdfplumber_page(page, start + offset, enable_tables, table_settings)
+            for offset, page in enumerate(pdf.pages)
+        ]
+
 class PDFExtractor:
-    """Efficient PDF extractor using pdfplumber for digital PDFs."""
+    """Efficient PDF extractor for digital PDFs using PyMuPDF, with pdfplumber as fallback."""
 
-    def __init__(self, enable_tables: bool = True):
+    def __init__(self, enable_tables: bool = True, max_workers: int = 1, table_settings: Optional[Dict[str, Any]] = None):
         self.enable_tables = enable_tables
+        self.table_settings = dict(table_settings or DEFAULT_TABLE_SETTINGS)
+        self.max_workers = max(1, max_workers)
 
     def extract_content(self, pdf_path: str) -> Dict[str, Any]:
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = "\n".join(page.extract_text() or "" for page in pdf.pages)
-
-                tables = []
-                if self.enable_tables:
-                    for page_num, page in enumerate(pdf.pages):
-                        for table_idx, table in enumerate(page.extract_tables()):
-                            if table:
-                                headers = table[0] if table else []
-                                rows = table[1:] if len(table) > 1 else []
-                                tables.append({
-                                    "id": f"table_{page_num}_{table_idx}",
-                                    "page": page_num + 1,
-                                    "headers": headers,
-                                    "rows": rows,
-                                    "row_count": len(rows),
-                                    "column_count": len(headers)
-                                })
-
-                output = {
-                    "text": text,
-                    "tables": tables,
-                    "metadata": {
-                        "page_count": len(pdf.pages),
-                        "table_count": len(tables),
-                        "text_length": len(text) if text else 0,
-                        "extraction_method": "pdfplumber"
-                    },
-                    "status": "success"
-                }
-                print("\n--- PDF Extraction Output ---\n", output, "\n--- End Output ---\n")
-                logger.debug(f"PDF Extraction Output: {output}")
-                return output
+            output = None
+            if pymupdf is not None:
+                try:
+                    # Everything is collected before returning, so a failure on any page can still
+                    # restart the whole file with pdfplumber
+                    output = self._build_output(list(self._iter_pymupdf(pdf_path)), "pymupdf")
+                except Exception as e:
+                    logger.warning(f"PyMuPDF extraction failed, falling back to pdfplumber: {e}")
+            if output is None:
+                output = self._build_output(list(self._iter_pdfplumber(pdf_path)), "pdfplumber")
+            metadata = output["metadata"]
+            logger.debug(
+                "PDF extracted: pages=%d tables=%d text_len=%d",
+                metadata["page_count"], metadata["table_count"], metadata["text_length"]
+            )
+            return output
         except Exception as e:
             logger.error(f"PDF extraction failed: {e}")
-            return {"text": "", "tables": [], "metadata": {"error": str(e)}, "status": "error"}
\ No newline at end of file
+            return {"text": "", "tables": [], "metadata": {"error": str(e)}, "status": "error"}
+
+    def iter_pages(self, pdf_path: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yield {"page", "text", "tables", "skipped"} for each page in order, so callers can
+        stream large reports without holding the whole document in memory
+        """
+        if pymupdf is not None:
+            started = False
+            try:
+                for page in self._iter_pymupdf(pdf_path):
+                    started = True
+                    yield page
+                return
+            except Exception as e:
+                # Pages already handed out cannot be taken back, so only fall back before the first one
+                if started:
+                    raise
+                logger.warning(f"PyMuPDF extraction failed, falling back to pdfplumber: {e}")
+        yield from self._iter_pdfplumber(pdf_path)
+
+    def _iter_pymupdf(self, pdf_path: str) -> Iterator[Dict[str, Any]]:
+        with pymupdf.open(pdf_path) as doc:
+            page_count = doc.page_count
+            if not self._use_pool(page_count):
+                for page_num, page in enumerate(doc):
+                    yield _pymupdf_page(page, page_num, self.enable_tables, self.table_settings)
+                return
+
+        yield from self._iter_parallel(pdf_path, page_count, "pymupdf")
+
+    def _iter_pdfplumber(self, pdf_path: str) -> Iterator[Dict[str, Any]]:
+        with pdfplumber.open(pdf_path) as pdf:
+            # Walk the page tree once and reuse the list for counting and iteration
+            pdf_pages = pdf.pages
+            page_count = len(pdf_pages)
+            if not self._use_pool(page_count):
+                for page_num, page in enumerate(pdf_pages):
+                    yield _pdfplumber_page(page, page_num, self.enable_tables, self.table_settings)
+                    # Drop the page's cached layout objects once it has been consumed
+                    page.close()
+                return
+
+        yield from self._iter_parallel(pdf_path, page_count, "pdfplumber")
+
+    def _use_pool(self, page_count: int) -> bool:
+        return self.max_workers > 1 and page_count >= MIN_PARALLEL_PAGES
+
+    def _iter_parallel(self, pdf_path: str, page_count: int, method: str) -> Iterator[Dict[str, Any]]:
+        """Split pages into one contiguous range per worker so each worker opens the PDF once"""
+        workers = min(self.max_workers, page_count)
+        bounds = [page_count * i // workers for i in range(workers + 1)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() yields chunks in page order as they complete
+            chunks = pool.map(
+                _extract_page_range,
+                repeat(pdf_path), bounds[:-1], bounds[1:],
+                repeat(self.enable_tables), repeat(self.table_settings), repeat(method)
+            )
+            for chunk in chunks:
+                yield from chunk
+
+    @staticmethod
+    def _build_output(pages: List[Dict[str, Any]], method: str) -> Dict[str, Any]:
+        text = "\n".join(page["text"] for page in pages)
+        tables = [table for page in pages for table in page["tables"]]
+        return {
+            "text": text,
+            "tables": tables,
+            "metadata": {
+                "page_count": len(pages),
+                "table_count": len(tables),
+                "text_length": len(text) if text else 0,
+                "skipped_pages": sum(1 for page in pages if page["skipped"]),
+                "extraction_method": method
+            },
+            "status": "success"
+        }
@@ -1,5 +1,6 @@
 import os
-import uuid
+import secrets
+import shutil
 import logging
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
@@ -7,24 +8,24 @@ from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+COPY_BUFFER_SIZE = 1024 * 1024  # 1MB
+
 class FileHandler:
     """Handle file uploads and management"""
     
     def __init__(self, upload_folder: str = "uploads"):
         self.upload_folder = upload_folder
         self.allowed_extensions = {'pdf'}
+        self._allowed_suffixes = tuple('.' + ext for ext in self.allowed_extensions)
         self._ensure_upload_folder()
     
     def _ensure_upload_folder(self):
         """Ensure upload folder exists"""
-        if not os.path.exists(self.upload_folder):
-            os.makedirs(self.upload_folder)
-            logger.info(f"Created upload folder: {self.upload_folder}")
+        os.makedirs(self.upload_folder, exist_ok=True)
     
     def is_allowed_file(self, filename: str) -> bool:
         """Check if file extension is allowed"""
-        return '.' in filename and \
-               filename.rsplit('.', 1)[1].lower() in self.allowed_extensions
+        return filename.lower().endswith(self._allowed_suffixes)
     
     def save_uploaded_file(self, file: FileStorage) -> Tuple[bool, str, Optional[str]]:
         """
@@ -39,31 +40,37 @@ class FileHandler:
             
             # Generate unique filename
             original_filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4().hex}_{original_filename}"
+            unique_filename = f"{secrets.token_hex(8)}_{original_filename}"
             filepath = os.path.join(self.upload_folder, unique_filename)
             
             # Save file
-            file.save(filepath)
+            with open(filepath, 'wb') as dst:
+                shutil.copyfileobj(file.stream, dst, length=COPY_BUFFER_SIZE)
+            
+            # Verify file was saved (single stat call)
+            try:
+                saved = os.stat(filepath).st_size > 0
+            except FileNotFoundError:
+                saved = False
             
-            # Verify file was saved
-            if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-                logger.info(f"✅ File saved: {filepath}")
+            if saved:
+                logger.info("File saved: %s", filepath)
                 return True, "File uploaded successfully", filepath
             else:
                 return False, "Failed to save file", None
                 
         except Exception as e:
-            logger.error(f"❌ Error saving file: {str(e)}")
+            logger.error("Error saving file: %s", e)
             return False, f"Error saving file: {str(e)}", None
     
     def cleanup_file(self, filepath: str) -> bool:
         """Clean up temporary file"""
         try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                logger.info(f"🗑️  Cleaned up file: {filepath}")
-                return True
+            os.remove(filepath)
+            logger.info("Cleaned up file: %s", filepath)
+            return True
+        except FileNotFoundError:
             return False
         except Exception as e:
-            logger.error(f"❌ Error cleaning up file {filepath}: {str(e)}")
+            logger.error("Error cleaning up file %s: %s", filepath, e)
             return False
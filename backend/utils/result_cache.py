@@ -0,0 +1,47 @@
+import hashlib
+import logging
+from typing import Any, Optional, Union
+import diskcache
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """Persistent cache of processing results keyed by content hash"""
+    
+    def __init__(self, cache_dir: str = "cache", ttl: int = 86400):
+        self.ttl = ttl
+        self._cache = diskcache.Cache(cache_dir)
+    
+    @staticmethod
+    def hasher():
+        """Return an incremental hasher for building keys from streamed content"""
+        return hashlib.blake2b(digest_size=16)
+    
+    @classmethod
+    def make_key(cls, *parts: Union[str, bytes]) -> str:
+        """Build a cache key from the hash of the given parts"""
+        hasher = cls.hasher()
+        for part in parts:
+            hasher.update(part.encode() if isinstance(part, str) else part)
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return cached value or None on miss"""
+        try:
+            return self._cache.get(key)
+        except Exception as e:
+            logger.warning(f"⚠️  Cache read failed for {key}: {str(e)}")
+            return None
+    
+    def set(self, key: str, value: Any) -> bool:
+        """Store value for the configured TTL"""
+        try:
+            return self._cache.set(key, value, expire=self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️  Cache write failed for {key}: {str(e)}")
+            return False
+    
+    def close(self):
+        """Close the underlying cache store"""
+        self._cache.close()
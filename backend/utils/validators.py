@@ -1,5 +1,17 @@
-import re
+from datetime import date
 from typing import Dict, Any, List, Optional
+from pydantic import TypeAdapter, ValidationError as SchemaValidationError
+
+from models.schemas import LabResultInput
+
+_ALLOWED_STATUS = frozenset({"normal", "high", "low", "critical"})
+_ALLOWED_CATEGORY = frozenset({"blood", "lipid", "liver", "kidney", "metabolic"})
+# Accepted gender spellings mapped to their canonical value
+_GENDER_MAP = {"m": "male", "male": "male", "f": "female", "female": "female"}
+
+# Field coercion (strip, float conversion) for lab results runs in pydantic-core
+_LAB_INPUTS_ADAPTER = TypeAdapter(List[LabResultInput])
+_LAB_INPUT_ADAPTER = TypeAdapter(LabResultInput)
 
 class ValidationError(Exception):
     """Custom validation error"""
@@ -45,15 +57,21 @@ class Validators:
             validated["age"] = None
         
         # Gender validation
-        gender = patient_data.get("gender", "").lower().strip()
-        if gender and gender not in ["male", "female", "m", "f"]:
+        gender = patient_data.get("gender", "").strip().lower()
+        validated["gender"] = _GENDER_MAP.get(gender) if gender else None
+        if gender and validated["gender"] is None:
             raise ValidationError("Invalid gender")
-        validated["gender"] = gender if gender else None
         
         # Date validation
         date_of_birth = patient_data.get("dateOfBirth")
         if date_of_birth:
-            if not re.match(r'^\d{4}-\d{2}-\d{2}$', date_of_birth):
+            # fromisoformat also rejects impossible dates like 2023-02-30; the round-trip check
+            # keeps out other ISO forms it accepts (20230101, 2023-W01-1)
+            try:
+                valid_date = date.fromisoformat(date_of_birth).isoformat() == date_of_birth
+            except (TypeError, ValueError):
+                valid_date = False
+            if not valid_date:
                 raise ValidationError("Invalid date format. Use YYYY-MM-DD")
         validated["dateOfBirth"] = date_of_birth
         
@@ -62,40 +80,29 @@ class Validators:
     @staticmethod
     def validate_lab_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Validate lab results"""
-        validated_results = []
-        
-        for result in results:
-            validated_result = {}
-            
-            # Test name validation
-            test_name = result.get("testName", "").strip()
-            if not test_name:
-                continue  # Skip empty test names
-            validated_result["testName"] = test_name
-            
-            # Value validation
-            try:
-                value = float(result.get("value", 0))
-                validated_result["value"] = value
-            except (ValueError, TypeError):
-                continue  # Skip invalid values
-            
-            # Unit validation
-            unit = result.get("unit", "").strip()
-            validated_result["unit"] = unit
-            
-            # Status validation
-            status = result.get("status", "normal").lower()
-            if status not in ["normal", "high", "low", "critical"]:
-                status = "normal"
-            validated_result["status"] = status
-            
-            # Category validation
-            category = result.get("category", "blood").lower()
-            if category not in ["blood", "lipid", "liver", "kidney", "metabolic"]:
-                category = "blood"
-            validated_result["category"] = category
-            
-            validated_results.append(validated_result)
+        try:
+            parsed = _LAB_INPUTS_ADAPTER.validate_python(results)
+        except SchemaValidationError:
+            # Validate row by row so invalid rows (e.g. non-numeric values) are skipped
+            parsed = []
+            for result in results:
+                try:
+                    parsed.append(_LAB_INPUT_ADAPTER.validate_python(result))
+                except SchemaValidationError:
+                    continue
         
-        return validated_results
+        # Skip empty test names and clamp status/category to the allowed values;
+        # the sets are bound to locals so the per-row membership tests skip global lookups
+        allowed_status = _ALLOWED_STATUS
+        allowed_category = _ALLOWED_CATEGORY
+        return [
+            {
+                "testName": result.testName,
+                "value": result.value,
+                "unit": result.unit,
+                "status": status if (status := result.status.lower()) in allowed_status else "normal",
+                "category": category if (category := result.category.lower()) in allowed_category else "blood"
+            }
+            for result in parsed
+            if result.testName
+        ]